@@ -1,8 +1,15 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
+import asyncio
 import os 
 from typing import Optional
 
+# Connection pool sizing, per worker process
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "10"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
 
@@ -14,7 +21,14 @@ class Database:
             if not mongodb_uri:
                 raise ValueError("MONGODB_URI not found in environment variables")
             try:
-                cls.client = AsyncIOMotorClient(mongodb_uri, serverSelectionTimeoutMS=5000)
+                cls.client = AsyncIOMotorClient(
+                    mongodb_uri,
+                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                    minPoolSize=MONGODB_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                    waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS
+                )
             except Exception as e:
                 print(f"Warning: MongoDB connection failed: {e}")
                 raise
@@ -28,6 +42,15 @@ class Database:
         db_name = os.getenv("DATABASE_NAME", "custom_ai_assistant")
         return client[db_name]
     
+    @classmethod
+    async def warm_up(cls):
+        """Ping the server and open minPoolSize connections up front"""
+        db = cls.get_database()
+        await db.command("ping")
+        # Concurrent pings each check out their own connection, filling the pool now
+        # instead of on the first requests.
+        await asyncio.gather(*(db.command("ping") for _ in range(MONGODB_MIN_POOL_SIZE)))
+
     @classmethod
     async def close(cls):
         """Close MongoDB client"""
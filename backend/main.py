@@ -2,33 +2,93 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Header
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
+import asyncio
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import os
 import sys
 from pathlib import Path
+from typing import Optional, Callable, Awaitable
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from models.schemas import ChatRequest, ChatResponse
-from services.ai_service import AIService
-from services.memory_service import MemoryService
+from services.ai_service import AIService, GenerationCancelled
+from services.memory_service import MemoryService, DEFAULT_OWNER, COMPRESSION_STATS_FLUSH_SECONDS
+from services.usage_service import UsageService
+from services.retrieval_service import RetrievalService
+from services.idempotency_service import IdempotencyService, IdempotencyKeyReused, IdempotencyInProgress
 from config.database import Database 
 
 
+# Backoff between warm-up attempts after a failure, in seconds
+WARM_UP_RETRY_INITIAL = 1.0
+WARM_UP_RETRY_MAX = 30.0
+
+async def _warm_up():
+    """Open the database pool, create indexes and load prompts"""
+    await Database.warm_up()
+    print("connected to database successfully")
+    await memory_service.ensure_indexes()
+    await usage_service.ensure_indexes()
+    await idempotency_service.ensure_indexes()
+    print("Database indexes ready")
+    ai_service.prompts = ai_service._load_prompts()
+    print(f"Loaded {len(ai_service.prompts['system_prompts'])} prompt modes")
+
+async def _retry_warm_up(app: FastAPI):
+    """Retry warm-up with exponential backoff; /ready turns 200 once it succeeds"""
+    delay = WARM_UP_RETRY_INITIAL
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await _warm_up()
+        except Exception as e:
+            delay = min(delay * 2, WARM_UP_RETRY_MAX)
+            print(f"ERROR: warm-up failed, retrying in {delay:.0f}s: {e}")
+            continue
+        app.state.ready = True
+        print("Warm-up complete, worker ready")
+        return
+
+async def _flush_stats_periodically():
+    """Persist in-process storage counters every few seconds"""
+    while True:
+        await asyncio.sleep(COMPRESSION_STATS_FLUSH_SECONDS)
+        try:
+            await memory_service.flush_compression_stats()
+        except Exception as e:
+            print(f"Warning: failed to flush compression stats: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("connecting to MongoDB....")
-    # Motor handles async connections lazily, just verify variables exist
-    mongodb_uri = os.getenv("MONGODB_URI")
-    if not mongodb_uri:
-        print("ERROR: MONGODB_URI not set in .env")
-    else:
-        print("MongoDB URI loaded successfully")
-    print("connected to database successfully")
+    app.state.ready = False
+    retry = None
+    print("Warming up....")
+    try:
+        await _warm_up()
+        app.state.ready = True
+        print("Warm-up complete, worker ready")
+    except Exception as e:
+        # e.g. MongoDB briefly unreachable during a deploy: keep trying in the background
+        print(f"ERROR: warm-up failed, retrying in {WARM_UP_RETRY_INITIAL:.0f}s: {e}")
+        retry = asyncio.create_task(_retry_warm_up(app))
+    stats_flush = asyncio.create_task(_flush_stats_periodically())
     
     yield
+    if retry:
+        retry.cancel()
+    stats_flush.cancel()
+    try:
+        await memory_service.flush_compression_stats()
+    except Exception as e:
+        print(f"Warning: failed to flush compression stats: {e}")
+    await ai_service.close()
     print("Closing database connection")
     await Database.close()
     print("Database connection closed")
@@ -51,9 +111,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (full conversations can be hundreds of KB)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Initialize services (lazy loading - database only connects when first used)
 ai_service = AIService()
 memory_service = MemoryService()
+usage_service = UsageService()
+retrieval_service = RetrievalService(memory_service)
+idempotency_service = IdempotencyService()
 
 @app.get("/")
 def read_root():
@@ -66,61 +132,198 @@ def read_root():
         
         }
 
+@app.get("/ready")
+def readiness(request: Request):
+    """Readiness probe: 200 only after warm-up has finished"""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Main chat endpoint"""
+async def chat(request: ChatRequest, http_request: Request, idempotency_key: Optional[str] = Header(None)):
+    """Main chat endpoint
+
+    Send the same `Idempotency-Key` header (or `idempotency_key` field) when
+    retrying: the turn then runs at most once and retries get its response.
+    """
+    owner_id = request.owner_id or DEFAULT_OWNER
+    key = idempotency_key or request.idempotency_key
+    if key:
+        # Keys are only unique per client, so scope them to the owner
+        key = f"{owner_id}:{key}"
+        fingerprint = IdempotencyService.fingerprint(request.message, request.mode, request.conversation_id)
+        try:
+            stored = await idempotency_service.claim(key, fingerprint)
+        except IdempotencyKeyReused:
+            raise HTTPException(status_code=422, detail="Idempotency key was already used for a different request")
+        except IdempotencyInProgress:
+            raise HTTPException(status_code=409, detail="A request with this idempotency key is still in progress")
+        if stored:
+            return ChatResponse(**stored)
+
     try:
-        # Create or get conversation
-        conversation_id = request.conversation_id
-        if not conversation_id:
-            conversation_id = await memory_service.create_conversation(request.mode)
-        
-        # Add user message to history
-        await memory_service.add_message(conversation_id, "user", request.message)
-        
-        # Get conversation history
-        history = await memory_service.get_conversation(conversation_id)
-        
-        # Generate AI response
-        ai_response = ai_service.generate_response(history, request.mode)
-        
-        # Save AI response to history
-        await memory_service.add_message(conversation_id, "assistant", ai_response)
-        
-        return ChatResponse(
-            response=ai_response,
-            conversation_id=conversation_id
+        # With a key, a disconnect is usually a client timeout about to be retried:
+        # finish the turn so the waiting retry replays it instead of running it again.
+        # Only keyless requests are abandoned when the client goes away.
+        is_disconnected = None if key else http_request.is_disconnected
+        response = await _run_chat_turn(request, owner_id, is_disconnected)
+    except GenerationCancelled:
+        # 499 Client Closed Request; nobody is listening, this only shows up in logs
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except Exception as e:
+        if key:
+            await idempotency_service.release(key)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if key:
+        await idempotency_service.complete(key, response.model_dump())
+    return response
+
+async def _run_chat_turn(request: ChatRequest, owner_id: str,
+                         is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> ChatResponse:
+    """Run one user turn: store the message, generate and store the reply
+
+    If `is_disconnected` reports the client gone while the reply is generating,
+    the upstream call is aborted, the user message is flagged cancelled and
+    GenerationCancelled raised.
+    """
+    # Create or get conversation
+    conversation_id = request.conversation_id
+    if not conversation_id:
+        conversation_id = await memory_service.create_conversation(request.mode, owner_id)
+    
+    # Add user message to history
+    message_id = await memory_service.add_message(
+        conversation_id, "user", request.message,
+        embedding=retrieval_service.embed(request.message), owner_id=owner_id
+    )
+    
+    # Get conversation history
+    history = await memory_service.get_conversation(conversation_id, owner_id=owner_id)
+
+    # Recall relevant turns older than the recent-history window
+    context = await retrieval_service.get_relevant_context(
+        conversation_id, request.message, len(history), owner_id
+    )
+    if context:
+        history = [context] + history
+    
+    # Generate AI response
+    try:
+        result = await ai_service.generate_response_with_usage(
+            history, request.mode, is_disconnected=is_disconnected
         )
+    except GenerationCancelled as cancelled:
+        await memory_service.mark_message_cancelled(conversation_id, message_id, owner_id)
+        retrieval_service.forget(conversation_id, owner_id)
+        try:
+            await usage_service.record_cancellation(cancelled.mode, cancelled.model)
+        except Exception as e:
+            print(f"Warning: failed to record cancellation: {e}")
+        raise
+    ai_response = result.pop("content")
+    mode = result.pop("mode")
     
+    # Save AI response to history
+    await memory_service.add_message(
+        conversation_id, "assistant", ai_response,
+        usage=result, embedding=retrieval_service.embed(ai_response), owner_id=owner_id
+    )
+
+    # Accounting must never cost the user their reply
+    try:
+        await usage_service.record(mode, **result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Warning: failed to record usage: {e}")
+    
+    return ChatResponse(
+        response=ai_response,
+        conversation_id=conversation_id
+    )
+
 @app.get("/conversation")
-async def list_conversation(limit: int = 50):
-    """Get list of all the conversations"""
+async def list_conversation(limit: int = 50, owner_id: str = DEFAULT_OWNER):
+    """Get list of an owner's conversations"""
     try:
-        conversations = await memory_service.get_all_conversations(limit)
+        conversations = await memory_service.get_all_conversations(limit, owner_id)
         return {"conversations": conversations, "count": len(conversations)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _validators(conversation_id: str, updated_at: datetime) -> dict:
+    """ETag / Last-Modified headers for a conversation version"""
+    updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return {
+        "ETag": f'"{conversation_id}-{int(updated_at.timestamp() * 1000):x}"',
+        "Last-Modified": format_datetime(updated_at, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+
+def _not_modified(request: Request, headers: dict, updated_at: datetime) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the current version"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            # "-0000" offsets parse as naive; HTTP dates are always UTC
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return updated_at.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
 @app.get("/conversation/{conversation_id}")
-async def get_conversation(conversation_id: str):
-    """Get full conversation"""
+async def get_conversation(conversation_id: str, request: Request, owner_id: str = DEFAULT_OWNER):
+    """Get full conversation, or 304 if the client's copy is current"""
     try:
-        conversation = await memory_service.get_conversation_detail(conversation_id)
+        # Probe updated_at only when there is a validator to check it against
+        if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+            updated_at = await memory_service.get_conversation_updated_at(conversation_id, owner_id)
+            if updated_at is None:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            headers = _validators(conversation_id, updated_at)
+            if _not_modified(request, headers, updated_at):
+                return Response(status_code=304, headers=headers)
+
+        conversation = await memory_service.get_conversation_detail(conversation_id, isoformat=False, owner_id=owner_id)
         if not conversation :
             raise HTTPException(status_code=404,detail="Conversation not found")
-        return conversation
+        return ORJSONResponse(
+            conversation,
+            headers=_validators(conversation_id, conversation["updated_at"])
+        )
     except HTTPException:
         raise 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/conversation/{conversation_id}/messages")
+async def get_conversation_messages(conversation_id: str, before: Optional[int] = None, limit: int = 20,
+                                    owner_id: str = DEFAULT_OWNER):
+    """Get a page of messages, newest first page when `before` is omitted"""
+    try:
+        page = await memory_service.get_messages_page(conversation_id, before, min(max(limit, 1), 200), owner_id)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return page
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/conversation/{conversation_id}")
-async def delete_conversation(conversation_id: str):
+async def delete_conversation(conversation_id: str, owner_id: str = DEFAULT_OWNER):
     """Delete a conversation"""
     try:
-        success = await memory_service.delete_conversation(conversation_id)
+        success = await memory_service.delete_conversation(conversation_id, owner_id)
+        retrieval_service.forget(conversation_id, owner_id)
         if not success:
             raise HTTPException(status_code=404, detail="Conversation not found")
         return {"message": "Conversation deleted successfully"}
@@ -137,6 +340,25 @@ def get_modes():
         "modes": list(ai_service.prompts["system_prompts"].keys())
     }
 
+@app.get("/stats/compression")
+async def get_compression_stats():
+    """Message compression ratio across all workers"""
+    try:
+        return await memory_service.get_compression_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stats/usage")
+async def get_usage_stats(granularity: str = "hour", hours: int = 24, mode: Optional[str] = None):
+    """Token usage and latency per (mode, model, bucket), read from rollups only"""
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    try:
+        rollups = await usage_service.get_stats(granularity, hours, mode)
+        return {"granularity": granularity, "rollups": rollups}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/debug/check-key")
 def check_key():
     """Debug: Check if API key is loaded"""
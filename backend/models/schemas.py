@@ -9,6 +9,8 @@ class ChatRequest(BaseModel):
     message: str
     mode: Optional[str] = "default"
     conversation_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    owner_id: Optional[str] = None
 
 
 
@@ -0,0 +1,41 @@
+"""One-off migration to owner-partitioned conversations
+
+Run once, before deploying the owner_id release:
+
+    python backend/scripts/migrate_owner_partitioning.py
+
+- assigns DEFAULT_OWNER_ID to conversations created before owner_id existed
+- creates the (owner_id, ...) indexes the app expects
+
+Safe to re-run. Workers only create indexes at startup and never migrate data.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.database import Database
+from services.memory_service import MemoryService, DEFAULT_OWNER
+
+
+async def migrate():
+    memory_service = MemoryService()
+    collection = memory_service.collection
+
+    result = await collection.update_many(
+        {"owner_id": {"$exists": False}},
+        {"$set": {"owner_id": DEFAULT_OWNER}}
+    )
+    print(f"Assigned owner '{DEFAULT_OWNER}' to {result.modified_count} conversations")
+
+    await memory_service.ensure_indexes()
+    print("Owner indexes ready")
+    await Database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
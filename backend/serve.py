@@ -0,0 +1,30 @@
+"""Production entry point: `python backend/serve.py`
+
+Runs the FastAPI app under uvicorn with several worker processes. Each worker
+warms up (MongoDB ping, connection pool, indexes, prompts) in the app lifespan
+and only reports ready on GET /ready once that has finished.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+from pathlib import Path
+
+import uvicorn
+
+
+def main():
+    uvicorn.run(
+        "main:app",
+        app_dir=str(Path(__file__).parent),
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "30")),
+        proxy_headers=True,
+        log_level=os.getenv("LOG_LEVEL", "info")
+    )
+
+
+if __name__ == "__main__":
+    main()
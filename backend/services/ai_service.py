@@ -1,11 +1,45 @@
+import asyncio
 import os 
+import time
+import httpx
 import yaml
-from groq import Groq
-from typing import List , Dict
+from groq import AsyncGroq
+from typing import List , Dict, Callable, Awaitable, Optional
+
+# Keep-alive pool for the Groq API, per worker process
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "60"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "120"))
+
+# How often a running completion checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+MODEL = "llama-3.3-70b-versatile"
+
+
+class GenerationCancelled(Exception):
+    """The client went away and the upstream completion was aborted"""
+
+    def __init__(self, mode: str, model: str):
+        super().__init__(mode, model)
+        self.mode = mode
+        self.model = model
+
 
 class AIService:
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+                ),
+                timeout=GROQ_TIMEOUT
+            )
+        )
         self.prompts = self._load_prompts()
 
     def _load_prompts(self) -> dict :
@@ -16,12 +50,16 @@ class AIService:
         with open(config_path, "r") as f:
             return yaml.safe_load(f)
 
+    def resolve_mode(self, mode: Optional[str]) -> str:
+        """The configured mode whose prompt `mode` maps to; unknown modes fall back to default"""
+        return mode if mode in self.prompts["system_prompts"] else "default"
+
     def get_system_prompt(self , mode: str ="default") ->str:
         """Get the system prompt based on the mode."""
-        return self.prompts["system_prompts"].get(mode, self.prompts["system_prompts"]["default"])
+        return self.prompts["system_prompts"][self.resolve_mode(mode)]
     
 
-    def generate_response(self, messages: List[Dict[str, str]], mode: str = "default") -> str:
+    async def generate_response(self, messages: List[Dict[str, str]], mode: str = "default") -> str:
         """ Generate AI response using OpenAI API
         
         Args:
@@ -31,6 +69,25 @@ class AIService:
         Returns:
         AI response as string
         """
+        return (await self.generate_response_with_usage(messages, mode))["content"]
+
+    async def generate_response_with_usage(
+        self,
+        messages: List[Dict[str, str]],
+        mode: str = "default",
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> Dict:
+        """ Generate AI response and report token usage and latency
+
+        Args:
+        is_disconnected: optional check polled while waiting; when it returns
+            True the upstream request is aborted and GenerationCancelled raised
+
+        Returns:
+        {"content", "mode", "model", "prompt_tokens", "completion_tokens", "latency_ms"}
+        where mode is the one whose prompt was used and model the one requested
+        """
+        mode = self.resolve_mode(mode)
         system_prompt = self.get_system_prompt(mode)
 
 
@@ -38,10 +95,32 @@ class AIService:
             {"role": "system" , "content": system_prompt}
 
         ] + messages
-        response = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        started = time.perf_counter()
+        completion = asyncio.ensure_future(self.client.chat.completions.create(
+            model=MODEL,
             messages = full_messages,
             temperature=0.4,
             max_tokens=10000
-        )
-        return response.choices[0].message.content
\ No newline at end of file
+        ))
+        if is_disconnected is not None:
+            while not completion.done():
+                await asyncio.wait({completion}, timeout=DISCONNECT_POLL_SECONDS)
+                if not completion.done() and await is_disconnected():
+                    # Cancelling the task closes the HTTP connection to Groq
+                    completion.cancel()
+                    raise GenerationCancelled(mode, MODEL)
+        response = await completion
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        usage = response.usage
+        return {
+            "content": response.choices[0].message.content,
+            "mode": mode,
+            "model": MODEL,
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "latency_ms": latency_ms
+        }
+
+    async def close(self):
+        """Close the pooled HTTP connections to Groq"""
+        await self.client.close()
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import os
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from config.database import get_db
+
+# How long a finished result is replayed for duplicates of the same key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long an in-progress attempt holds the key before another worker may take over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "180"))
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request body"""
+
+
+class IdempotencyInProgress(Exception):
+    """Another attempt with this key is still running after the wait limit"""
+
+
+class IdempotencyService:
+
+    """Idempotency keys for POST /chat.
+    The first attempt claims the key and runs the turn; concurrent duplicates
+    wait for it and later duplicates get the stored response back, so a retry
+    never produces a second completion or duplicate messages.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._collection = None
+
+    @property
+    def db(self):
+        """Lazy load database on first access"""
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+
+    @property
+    def collection(self):
+        """Lazy load collection on first access"""
+        if self._collection is None:
+            self._collection = self.db.idempotency_keys
+        return self._collection
+
+    async def ensure_indexes(self):
+        """TTL index so finished keys expire on their own"""
+        await self.collection.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+    @staticmethod
+    def fingerprint(*parts: Optional[str]) -> str:
+        """Hash of the request fields a key must keep matching"""
+        return hashlib.sha256("\x1f".join(part or "" for part in parts).encode("utf-8")).hexdigest()
+
+    async def claim(self, key: str, fingerprint: str, wait_seconds: float = IDEMPOTENCY_LOCK_SECONDS) -> Optional[Dict]:
+        """Claim `key` for this attempt
+
+        Returns:
+            None if the caller now owns the key and must run the request,
+            otherwise the stored response of the attempt that finished first
+        Raises:
+            IdempotencyKeyReused: the key belongs to a different request
+            IdempotencyInProgress: the owning attempt did not finish in time
+        """
+        deadline = asyncio.get_running_loop().time() + wait_seconds
+        while True:
+            now = datetime.utcnow()
+            try:
+                await self.collection.insert_one({
+                    "_id": key,
+                    "fingerprint": fingerprint,
+                    "status": "in_progress",
+                    "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                    "created_at": now
+                })
+                return None
+            except DuplicateKeyError:
+                pass
+
+            existing = await self.collection.find_one({"_id": key})
+            if existing:
+                if existing["fingerprint"] != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                if existing["status"] == "completed":
+                    return existing["response"]
+
+                # The owner died without finishing or releasing: take over its lock
+                if existing["locked_until"] < now:
+                    taken = await self.collection.update_one(
+                        {"_id": key, "status": "in_progress", "locked_until": existing["locked_until"]},
+                        {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+                    )
+                    if taken.modified_count:
+                        return None
+
+            if asyncio.get_running_loop().time() >= deadline:
+                raise IdempotencyInProgress(key)
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def complete(self, key: str, response: Dict):
+        """Store the result so duplicates can replay it until the key expires"""
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"status": "completed", "response": response, "created_at": datetime.utcnow()}}
+        )
+
+    async def release(self, key: str):
+        """Give the key up after a failed attempt so a retry can run again"""
+        await self.collection.delete_one({"_id": key, "status": "in_progress"})
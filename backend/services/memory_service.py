@@ -1,9 +1,29 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+import os
 import uuid
+import zlib
+from bson import Binary
+from pymongo import ReturnDocument
 from config.database import get_db
 from models.database_models import Conversation, Message
 
+# Message bodies at or above this size (UTF-8 bytes) are stored zlib-compressed.
+# Set MESSAGE_COMPRESSION=none to store everything as plain strings.
+COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "zlib").lower()
+COMPRESSION_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESSION_MIN_BYTES", "2048"))
+COMPRESSION_LEVEL = int(os.getenv("MESSAGE_COMPRESSION_LEVEL", "6"))
+# How often each worker adds its compression counters to the shared stats document
+COMPRESSION_STATS_FLUSH_SECONDS = float(os.getenv("COMPRESSION_STATS_FLUSH_SECONDS", "30"))
+
+# Owner (user/tenant) for requests that don't name one, and for documents
+# written before conversations were partitioned by owner
+DEFAULT_OWNER = os.getenv("DEFAULT_OWNER_ID", "public")
+
+# User messages whose reply was abandoned stay stored but never reach a prompt,
+# neither as recent history nor through retrieval
+NOT_CANCELLED = {"$ne": True}
+
 class MemoryService:
     
     """MongoDB-backend conversation storage.
@@ -13,6 +33,8 @@ class MemoryService:
     def __init__(self):
         self._db = None
         self._collection = None
+        # Counted in process and flushed with one $inc, keeping writes off the hot path
+        self._pending_compression = self._empty_compression_counters()
     
     @property
     def db(self):
@@ -28,12 +50,110 @@ class MemoryService:
             self._collection = self.db.conversations
         return self._collection
 
+    @property
+    def embeddings_collection(self):
+        """Retrieval vectors, one document per message, kept out of the conversation document"""
+        return self.db.message_embeddings
 
-    async def create_conversation(self, mode: str = "default") -> str:
+    @property
+    def stats_collection(self):
+        """Storage counters shared by all workers"""
+        return self.db.storage_stats
+
+    async def ensure_indexes(self):
+        """Create the indexes the read paths rely on (no-op if they exist)
+
+        (owner_id, conversation_id) is the unique key and the intended shard key;
+        (owner_id, updated_at) serves per-owner listing. Backfilling owner_id on
+        older documents is done once by scripts/migrate_owner_partitioning.py.
+        """
+        await self.collection.create_index([("owner_id", 1), ("conversation_id", 1)], unique=True)
+        await self.collection.create_index([("owner_id", 1), ("updated_at", -1)])
+        await self.embeddings_collection.create_index(
+            [("owner_id", 1), ("conversation_id", 1), ("index", 1)], unique=True
+        )
+
+    @staticmethod
+    def _key(conversation_id: str, owner_id: str) -> Dict:
+        """Filter addressing one conversation within its owner's partition"""
+        return {"owner_id": owner_id, "conversation_id": conversation_id}
+
+    @staticmethod
+    def _encode_content(content: str) -> Dict:
+        """Build the stored form of a message body, compressing large ones"""
+        raw = content.encode("utf-8")
+        if COMPRESSION != "zlib" or len(raw) < COMPRESSION_MIN_BYTES:
+            return {"content": content}
+
+        compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+        if len(compressed) >= len(raw):
+            return {"content": content}
+        return {"content": Binary(compressed), "compression": "zlib"}
+
+    @staticmethod
+    def _empty_compression_counters() -> Dict:
+        return {"messages": 0, "compressed_messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    def _record_compression(self, content: str, stored: Dict):
+        """Count one written message body; flush_compression_stats() persists the totals"""
+        raw_bytes = len(content.encode("utf-8"))
+        compressed = stored.get("compression") == "zlib"
+        pending = self._pending_compression
+        pending["messages"] += 1
+        pending["compressed_messages"] += 1 if compressed else 0
+        pending["raw_bytes"] += raw_bytes
+        pending["stored_bytes"] += len(stored["content"]) if compressed else raw_bytes
+
+    async def flush_compression_stats(self):
+        """Add this worker's pending counters to the shared stats document"""
+        pending = self._pending_compression
+        if not pending["messages"]:
+            return
+        self._pending_compression = self._empty_compression_counters()
+        try:
+            await self.stats_collection.update_one(
+                {"_id": "message_compression"},
+                {"$inc": pending},
+                upsert=True
+            )
+        except Exception:
+            # Keep the counts for the next flush
+            for name, value in pending.items():
+                self._pending_compression[name] += value
+            raise
+
+    @staticmethod
+    def _decode_content(msg: Dict) -> str:
+        """Return the message body as text, decompressing only if it was stored compressed"""
+        if msg.get("compression") == "zlib":
+            return zlib.decompress(bytes(msg["content"])).decode("utf-8")
+        return msg["content"]
+
+    async def get_compression_stats(self) -> Dict:
+        """Compression counters for all messages written since tracking began
+
+        Other workers' most recent writes show up after their next flush.
+        """
+        stats = await self.stats_collection.find_one({"_id": "message_compression"}, {"_id": 0}) \
+            or self._empty_compression_counters()
+        for name, value in self._pending_compression.items():
+            stats[name] = stats.get(name, 0) + value
+        stats["algorithm"] = COMPRESSION
+        stats["min_bytes"] = COMPRESSION_MIN_BYTES
+        stats["ratio"] = (
+            round(stats["raw_bytes"] / stats["stored_bytes"], 2)
+            if stats["stored_bytes"] else None
+        )
+        return stats
+
+
+    async def create_conversation(self, mode: str = "default", owner_id: str = DEFAULT_OWNER,
+                                  conversation_id: Optional[str] = None) -> str:
         """Create new conversation and return its ID"""
-        conversation_id = str(uuid.uuid4())
+        conversation_id = conversation_id or str(uuid.uuid4())
 
         conversation = {
+            "owner_id": owner_id,
             "conversation_id": conversation_id,
             "title": None,
             "mode": mode,
@@ -44,91 +164,276 @@ class MemoryService:
         await self.collection.insert_one(conversation)
         return conversation_id
     
-    async def add_message(self, conversation_id: str, role: str, content: str):
-        """Add message to conversation"""
+    async def add_message(self, conversation_id: str, role: str, content: str,
+                          usage: Optional[Dict] = None, embedding: Optional[bytes] = None,
+                          owner_id: str = DEFAULT_OWNER) -> str:
+        """Add message to conversation and return its message_id
+
+        Args:
+            usage: optional generation stats stored with assistant messages
+                (model, prompt_tokens, completion_tokens, latency_ms)
+            embedding: optional packed float32 vector used for retrieval
+        """
+        stored = self._encode_content(content)
         message = {
+            "message_id": str(uuid.uuid4()),
             "role": role,
-            "content": content,
+            **stored,
             "timestamp": datetime.utcnow()
         }
+        if usage:
+            message["usage"] = usage
         
-        # Update messages array and updated_at timestamp
-        result = await self.collection.update_one(
-            {"conversation_id": conversation_id},
+        # Update messages array and updated_at timestamp; the post-image size gives the new message's index
+        result = await self.collection.find_one_and_update(
+            self._key(conversation_id, owner_id),
             {
                 "$push": {"messages": message},
                 "$set": {"updated_at": datetime.utcnow()}
-            }
+            },
+            projection={"_id": 0, "count": {"$size": "$messages"}},
+            return_document=ReturnDocument.AFTER
         )
 
         # if convo doesn't exist
-        if result.matched_count == 0:
-            await self.create_conversation()
-            await self.add_message(conversation_id, role, content)
+        if result is None:
+            await self.create_conversation(owner_id=owner_id, conversation_id=conversation_id)
+            return await self.add_message(conversation_id, role, content, usage, embedding, owner_id)
         
+        if embedding is not None:
+            await self.embeddings_collection.insert_one({
+                **self._key(conversation_id, owner_id),
+                "index": result["count"] - 1,
+                "message_id": message["message_id"],
+                "embedding": Binary(embedding)
+            })
+
         # Auto generate conversation name
-        await self._update_title_if_needed(conversation_id, content, role)
+        await self._update_title_if_needed(conversation_id, content, role, owner_id)
+        self._record_compression(content, stored)
+        return message["message_id"]
 
-    async def _update_title_if_needed(self, conversation_id: str, content: str, role: str):
+    async def mark_message_cancelled(self, conversation_id: str, message_id: str,
+                                     owner_id: str = DEFAULT_OWNER) -> bool:
+        """Flag a user message whose reply was abandoned because the client disconnected"""
+        result = await self.collection.update_one(
+            {**self._key(conversation_id, owner_id), "messages.message_id": message_id},
+            {"$set": {"messages.$.cancelled": True, "updated_at": datetime.utcnow()}}
+        )
+        await self.embeddings_collection.update_one(
+            {**self._key(conversation_id, owner_id), "message_id": message_id},
+            {"$set": {"cancelled": True}}
+        )
+        return result.modified_count > 0
+
+    async def _update_title_if_needed(self, conversation_id: str, content: str, role: str,
+                                      owner_id: str = DEFAULT_OWNER):
         """Generate conversation title based on first user message"""
         if role == "user":
-            conversation = await self.collection.find_one({"conversation_id": conversation_id})
-            if conversation and not conversation.get("title"):
-                title = content[:50] + ("..." if len(content) > 50 else "")
-                await self.collection.update_one(
-                    {"conversation_id": conversation_id},
-                    {"$set": {"title": title}}
-                )
+            title = content[:50] + ("..." if len(content) > 50 else "")
+            await self.collection.update_one(
+                {**self._key(conversation_id, owner_id), "title": None},
+                # Bump updated_at so ETags cached before the title existed go stale
+                {"$set": {"title": title, "updated_at": datetime.utcnow()}}
+            )
     
-    async def get_conversation(self, conversation_id: str, last_n: int = 10) -> List[Dict[str, str]]:
+    async def get_conversation(self, conversation_id: str, last_n: int = 10, owner_id: str = DEFAULT_OWNER) -> List[Dict[str, str]]:
         """Get conversation history
         Args:
             conversation_id: which conversation 
         Returns: 
             List of messages (role + content only without timestamps)
         """
-        conversation = await self.collection.find_one({"conversation_id": conversation_id})
+        pipeline = [
+            {"$match": self._key(conversation_id, owner_id)},
+            {"$project": {
+                "_id": 0,
+                "messages": {"$filter": {
+                    "input": "$messages",
+                    # A missing flag means not cancelled
+                    "cond": {"$ne": [{"$ifNull": ["$$this.cancelled", False]}, True]}
+                }}
+            }},
+            {"$project": {"messages": {"$slice": ["$messages", -last_n]}}}
+        ]
+        results = await self.collection.aggregate(pipeline).to_list(length=1)
         
-        if not conversation:
+        if not results:
             return []
-        messages = conversation.get("messages", [])
-        recent_messages = messages[-last_n:] if len(messages) > last_n else messages
+        recent_messages = results[0].get("messages") or []
         
         # Return in format expected by AI service (without timestamps)
         return [
-            {"role": msg["role"], "content": msg["content"]}
+            {"role": msg["role"], "content": self._decode_content(msg)}
             for msg in recent_messages
         ]
     
-    async def get_all_conversations(self, limit: int = 50) -> List[Dict]:
+    async def get_recent_window_start(self, conversation_id: str, skip_last: int,
+                                      owner_id: str = DEFAULT_OWNER) -> Optional[int]:
+        """Index of the oldest of the newest `skip_last` non-cancelled embedded messages
+
+        `skip_last` counts the same messages get_conversation returns, so vectors
+        below this index never overlap the recent history in the prompt.
+
+        Returns:
+            None when nothing is skipped, 0 when every stored vector is inside the window
         """
-        Get list of all conversations
+        if not skip_last:
+            return None
+        row = await self.embeddings_collection.find_one(
+            {**self._key(conversation_id, owner_id), "cancelled": NOT_CANCELLED},
+            {"_id": 0, "index": 1},
+            sort=[("index", -1)],
+            skip=skip_last - 1
+        )
+        return row["index"] if row else 0
+
+    async def get_embeddings(self, conversation_id: str, after_index: int = -1,
+                             before_index: Optional[int] = None,
+                             owner_id: str = DEFAULT_OWNER) -> Tuple[List[int], List[bytes]]:
+        """Get stored embeddings of non-cancelled messages with after_index < index < before_index
+
+        Returns:
+            (message indexes, packed float32 vectors), in message order
+        """
+        index = {"$gt": after_index}
+        if before_index is not None:
+            index["$lt"] = before_index
+        cursor = self.embeddings_collection.find(
+            {**self._key(conversation_id, owner_id), "index": index, "cancelled": NOT_CANCELLED},
+            {"_id": 0, "index": 1, "embedding": 1}
+        ).sort("index", 1)
+        rows = await cursor.to_list(length=None)
+        return [row["index"] for row in rows], [bytes(row["embedding"]) for row in rows]
+
+    async def get_messages_at(self, conversation_id: str, indexes: List[int], owner_id: str = DEFAULT_OWNER) -> List[Dict[str, str]]:
+        """Get specific messages by position (role + content), in the order given"""
+        if not indexes:
+            return []
+        pipeline = [
+            {"$match": self._key(conversation_id, owner_id)},
+            {"$project": {
+                "_id": 0,
+                "picked": [{"$arrayElemAt": ["$messages", index]} for index in indexes]
+            }}
+        ]
+        results = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not results:
+            return []
+        return [
+            {"role": msg["role"], "content": self._decode_content(msg)}
+            for msg in results[0]["picked"]
+        ]
+
+    async def get_messages_page(self, conversation_id: str, before: Optional[int] = None, limit: int = 20, owner_id: str = DEFAULT_OWNER) -> Optional[Dict]:
+        """Get one page of messages without loading the whole history
+
+        Args:
+            conversation_id: which conversation
+            before: index of the first message already held by the caller (None = newest page)
+            limit: maximum number of messages to return
+        Returns:
+            {"messages": [...], "start": index of the first returned message, "total": message count}
+        """
+        if before is None:
+            window = ["$messages", -limit]
+        else:
+            before = max(before, 0)
+            start = max(before - limit, 0)
+            # $slice needs a positive count; an empty window is trimmed below
+            window = ["$messages", start, max(before - start, 1)]
+        pipeline = [
+            {"$match": self._key(conversation_id, owner_id)},
+            {"$project": {
+                "_id": 0,
+                "total": {"$size": "$messages"},
+                "messages": {"$slice": window}
+            }}
+        ]
+        results = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not results:
+            return None
+
+        total = results[0]["total"]
+        if before is not None and before > total:
+            # Window was computed past the end; re-read it clamped to the real size
+            return await self.get_messages_page(conversation_id, total, limit, owner_id)
+        end_index = total if before is None else before
+        if end_index <= 0:
+            return {"messages": [], "start": 0, "total": total}
+
+        return {
+            "messages": [
+                {
+                    "role": msg["role"],
+                    "content": self._decode_content(msg),
+                    "timestamp": msg["timestamp"].isoformat(),
+                    **({"cancelled": True} if msg.get("cancelled") else {})
+                }
+                for msg in results[0]["messages"]
+            ],
+            "start": max(end_index - limit, 0),
+            "total": total
+        }
+
+    async def get_all_conversations(self, limit: int = 50, owner_id: str = DEFAULT_OWNER) -> List[Dict]:
+        """
+        Get list of an owner's conversations, most recently updated first
 
         Returns:
             List of conversation summaries (id, title, message count, etc.)
         """
-        cursor = self.collection.find().sort("updated_at", -1).limit(limit)
-        conversations = await cursor.to_list(length=limit)
+        # Served by the (owner_id, updated_at) index; message bodies never leave MongoDB
+        pipeline = [
+            {"$match": {"owner_id": owner_id}},
+            {"$sort": {"updated_at": -1}},
+            {"$limit": limit},
+            {"$project": {
+                "_id": 0,
+                "conversation_id": 1,
+                "title": 1,
+                "mode": 1,
+                "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+                "created_at": 1,
+                "updated_at": 1
+            }}
+        ]
+        conversations = await self.collection.aggregate(pipeline).to_list(length=limit)
         
         return [
             {
                 "conversation_id": conv["conversation_id"],
                 "title": conv.get("title", "Untitled"),
                 "mode": conv.get("mode", "default"),
-                "message_count": len(conv.get("messages", [])),
+                "message_count": conv["message_count"],
                 "created_at": conv["created_at"].isoformat(),
                 "updated_at": conv["updated_at"].isoformat()
             }
             for conv in conversations
         ]
     
-    async def get_conversation_detail(self, conversation_id: str) -> Optional[Dict]:
-        """Get full conversation with all messages"""
-        conversation = await self.collection.find_one({"conversation_id": conversation_id})
+    async def get_conversation_updated_at(self, conversation_id: str, owner_id: str = DEFAULT_OWNER) -> Optional[datetime]:
+        """Get only the last-modified time of a conversation (no messages are read)"""
+        conversation = await self.collection.find_one(
+            self._key(conversation_id, owner_id),
+            {"_id": 0, "updated_at": 1}
+        )
+        return conversation["updated_at"] if conversation else None
+
+    async def get_conversation_detail(self, conversation_id: str, isoformat: bool = True, owner_id: str = DEFAULT_OWNER) -> Optional[Dict]:
+        """Get full conversation with all messages
+
+        Args:
+            conversation_id: which conversation
+            isoformat: convert timestamps to ISO strings; pass False when the
+                response serializer handles datetimes natively (e.g. orjson)
+        """
+        conversation = await self.collection.find_one(self._key(conversation_id, owner_id))
         
         if not conversation:
             return None
-        
+
+        fmt = (lambda ts: ts.isoformat()) if isoformat else (lambda ts: ts)
         return {
             "conversation_id": conversation["conversation_id"],
             "title": conversation.get("title", "Untitled"),
@@ -136,24 +441,26 @@ class MemoryService:
             "messages": [
                 {
                     "role": msg["role"],
-                    "content": msg["content"],
-                    "timestamp": msg["timestamp"].isoformat()
+                    "content": self._decode_content(msg),
+                    "timestamp": fmt(msg["timestamp"]),
+                    **({"cancelled": True} if msg.get("cancelled") else {})
                 }
                 for msg in conversation.get("messages", [])
             ],
-            "created_at": conversation["created_at"].isoformat(),
-            "updated_at": conversation["updated_at"].isoformat()
+            "created_at": fmt(conversation["created_at"]),
+            "updated_at": fmt(conversation["updated_at"])
         }
     
-    async def delete_conversation(self, conversation_id: str) -> bool:
+    async def delete_conversation(self, conversation_id: str, owner_id: str = DEFAULT_OWNER) -> bool:
         """Delete a conversation"""
-        result = await self.collection.delete_one({"conversation_id": conversation_id})
+        result = await self.collection.delete_one(self._key(conversation_id, owner_id))
+        await self.embeddings_collection.delete_many(self._key(conversation_id, owner_id))
         return result.deleted_count > 0
     
-    async def update_conversation_mode(self, conversation_id: str, mode: str) -> bool:
+    async def update_conversation_mode(self, conversation_id: str, mode: str, owner_id: str = DEFAULT_OWNER) -> bool:
         """Update conversation mode"""
         result = await self.collection.update_one(
-            {"conversation_id": conversation_id},
+            self._key(conversation_id, owner_id),
             {"$set": {"mode": mode, "updated_at": datetime.utcnow()}}
         )
         return result.modified_count > 0
@@ -0,0 +1,147 @@
+import os
+import re
+import zlib
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+# Long-term memory: pull relevant turns older than the recent-history window
+# back into the prompt. Off unless RETRIEVAL_ENABLED=true.
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "false").lower() == "true"
+RETRIEVAL_DIM = int(os.getenv("RETRIEVAL_DIM", "512"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.15"))
+RETRIEVAL_CHAR_BUDGET = int(os.getenv("RETRIEVAL_CHAR_BUDGET", "4000"))
+# Conversations whose stacked vectors each worker keeps in memory
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class RetrievalService:
+
+    """Local vector retrieval over a conversation's older messages.
+    Embeddings are signed feature-hashing vectors of unigrams and bigrams,
+    stored as packed float32 bytes next to each message, so no model or network
+    call is needed at write or query time.
+    """
+
+    def __init__(self, memory_service):
+        self.memory_service = memory_service
+        self.enabled = RETRIEVAL_ENABLED
+        self.dim = RETRIEVAL_DIM
+        # LRU of (owner_id, conversation_id) -> (message indexes, stacked vectors)
+        self._matrices: "OrderedDict[Tuple[str, str], Tuple[List[int], np.ndarray]]" = OrderedDict()
+
+    def _vector(self, text: str) -> np.ndarray:
+        """L2-normalised hashing vector for `text`"""
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+
+        # Sublinear term frequency keeps repeated words from dominating
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, text: str) -> Optional[bytes]:
+        """Packed float32 embedding to store with a message, None when retrieval is off"""
+        if not self.enabled:
+            return None
+        return self._vector(text).tobytes()
+
+    def _stack(self, indexes: List[int], embeddings: List[bytes]) -> Tuple[List[int], np.ndarray]:
+        """Stack packed vectors into a matrix, skipping any written with another dimension"""
+        row_bytes = self.dim * 4
+        keep = [i for i, emb in enumerate(embeddings) if len(emb) == row_bytes]
+        matrix = np.frombuffer(b"".join(embeddings[i] for i in keep), dtype=np.float32)
+        return [indexes[i] for i in keep], matrix.reshape(len(keep), self.dim)
+
+    def top_k(self, query: str, matrix: np.ndarray, k: int) -> List[int]:
+        """Rows of `matrix` most similar to `query`, best first"""
+        if not len(matrix):
+            return []
+        scores = matrix @ self._vector(query)
+
+        k = min(k, len(matrix))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [int(i) for i in best if scores[i] >= RETRIEVAL_MIN_SCORE]
+
+    async def _older_vectors(self, conversation_id: str, skip_last: int,
+                             owner_id: str) -> Tuple[List[int], np.ndarray]:
+        """Vectors older than the recent-history window, reading only rows newer than the cached ones
+
+        Cancellation only hits the newest message, which is always inside the
+        window, so rows cached once they fell out of it stay valid.
+        """
+        before = await self.memory_service.get_recent_window_start(conversation_id, skip_last, owner_id)
+
+        cache_key = (owner_id, conversation_id)
+        indexes, matrix = self._matrices.pop(cache_key, ([], np.empty((0, self.dim), dtype=np.float32)))
+        new_indexes, embeddings = await self.memory_service.get_embeddings(
+            conversation_id, indexes[-1] if indexes else -1, before, owner_id=owner_id
+        )
+        if new_indexes:
+            new_indexes, rows = self._stack(new_indexes, embeddings)
+            indexes, matrix = indexes + new_indexes, np.concatenate([matrix, rows])
+
+        self._matrices[cache_key] = (indexes, matrix)
+        while len(self._matrices) > RETRIEVAL_CACHE_SIZE:
+            self._matrices.popitem(last=False)
+
+        # The window can reach further back after a cancellation in another worker
+        if before is not None and indexes and indexes[-1] >= before:
+            keep = int(np.searchsorted(indexes, before))
+            return indexes[:keep], matrix[:keep]
+        return indexes, matrix
+
+    def forget(self, conversation_id: str, owner_id: str):
+        """Drop the cached vectors of a conversation that was deleted or had a message cancelled"""
+        self._matrices.pop((owner_id, conversation_id), None)
+
+    async def get_relevant_context(self, conversation_id: str, query: str, skip_last: int,
+                                   owner_id: str) -> Optional[Dict[str, str]]:
+        """Build a system message with the older turns most relevant to `query`
+
+        Args:
+            conversation_id: which conversation
+            query: the new user message
+            skip_last: number of newest messages already in the prompt
+            owner_id: owner of the conversation
+        Returns:
+            {"role": "system", "content": ...} or None if nothing relevant fits
+        """
+        if not self.enabled:
+            return None
+
+        positions, matrix = await self._older_vectors(conversation_id, skip_last, owner_id)
+        indexes = [positions[i] for i in self.top_k(query, matrix, RETRIEVAL_TOP_K)]
+        if not indexes:
+            return None
+
+        messages = await self.memory_service.get_messages_at(conversation_id, indexes, owner_id=owner_id)
+
+        # Fill the budget in relevance order, then restore chronological order
+        picked, remaining = [], RETRIEVAL_CHAR_BUDGET
+        for index, msg in zip(indexes, messages):
+            if remaining <= 0:
+                break
+            content = msg["content"][:remaining]
+            remaining -= len(content)
+            picked.append((index, f"[{msg['role']}] {content}"))
+        picked.sort()
+
+        return {
+            "role": "system",
+            "content": "Relevant earlier messages from this conversation:\n\n"
+                       + "\n\n".join(text for _, text in picked)
+        }
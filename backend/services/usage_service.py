@@ -0,0 +1,98 @@
+from typing import List, Dict, Optional
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from config.database import get_db
+
+GRANULARITIES = ("hour", "day")
+
+
+class UsageService:
+
+    """Token usage rollups.
+    One document per (granularity, bucket, mode, model), maintained with $inc
+    at write time so reports never scan the conversations collection.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._collection = None
+
+    @property
+    def db(self):
+        """Lazy load database on first access"""
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+
+    @property
+    def collection(self):
+        """Lazy load collection on first access"""
+        if self._collection is None:
+            self._collection = self.db.usage_rollups
+        return self._collection
+
+    async def ensure_indexes(self):
+        """Unique rollup key; also serves bucket range queries"""
+        await self.collection.create_index(
+            [("granularity", 1), ("bucket", -1), ("mode", 1), ("model", 1)],
+            unique=True
+        )
+
+    @staticmethod
+    def _bucket(at: datetime, granularity: str) -> datetime:
+        if granularity == "hour":
+            return at.replace(minute=0, second=0, microsecond=0)
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async def _apply(self, mode: str, model: str, update: Dict, at: Optional[datetime]):
+        """Apply `update` to the hourly and daily rollup documents for `at`"""
+        at = at or datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {
+                    "granularity": granularity,
+                    "bucket": self._bucket(at, granularity),
+                    "mode": mode,
+                    "model": model
+                },
+                update,
+                upsert=True
+            )
+            for granularity in GRANULARITIES
+        ], ordered=False)
+
+    async def record(self, mode: str, model: str, prompt_tokens: int,
+                     completion_tokens: int, latency_ms: int, at: Optional[datetime] = None):
+        """Add one completion to the hourly and daily rollups"""
+        await self._apply(mode, model, {
+            "$inc": {
+                "requests": 1,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "latency_ms_total": latency_ms
+            },
+            "$max": {"latency_ms_max": latency_ms}
+        }, at)
+
+    async def record_cancellation(self, mode: str, model: str, at: Optional[datetime] = None):
+        """Count a completion aborted because the client disconnected"""
+        await self._apply(mode, model, {"$inc": {"cancelled": 1}}, at)
+
+    async def get_stats(self, granularity: str = "hour", hours: int = 24,
+                        mode: Optional[str] = None) -> List[Dict]:
+        """Read rollup rows for the last `hours` hours, newest bucket first"""
+        since = self._bucket(datetime.utcnow() - timedelta(hours=hours), granularity)
+        query = {"granularity": granularity, "bucket": {"$gte": since}}
+        if mode:
+            query["mode"] = mode
+
+        cursor = self.collection.find(query, {"_id": 0}).sort("bucket", -1)
+        rows = await cursor.to_list(length=None)
+        for row in rows:
+            row["bucket"] = row["bucket"].isoformat()
+            row["latency_ms_avg"] = (
+                round(row.get("latency_ms_total", 0) / row["requests"], 1)
+                if row.get("requests") else None
+            )
+        return rows
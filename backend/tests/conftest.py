@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# Tests import modules the same way main.py does (from the backend directory)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# AIService builds its Groq client at import time; no request is ever sent in tests
+os.environ.setdefault("GROQ_API_KEY", "test-key")
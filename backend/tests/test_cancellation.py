@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import Binary
+from mongomock_motor import AsyncMongoMockClient
+
+import main
+from models.schemas import ChatRequest
+from services import ai_service as ai_module
+from services.ai_service import AIService, GenerationCancelled, MODEL
+from services.memory_service import MemoryService
+from services.usage_service import UsageService
+
+
+class HangingCompletions:
+    """Groq completions stub that never answers and records being cancelled"""
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def create(self, **kwargs):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.fixture
+def ai(monkeypatch):
+    monkeypatch.setattr(ai_module, "DISCONNECT_POLL_SECONDS", 0.01)
+    service = AIService()
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=HangingCompletions()))
+    return service
+
+
+@pytest.fixture
+def memory():
+    service = MemoryService()
+    service._db = AsyncMongoMockClient()["test"]
+    asyncio.run(service.collection.insert_one({
+        "owner_id": "public",
+        "conversation_id": "c1",
+        "messages": [
+            {"message_id": f"m{i}", "role": "user", "content": f"message {i}"}
+            for i in range(3)
+        ]
+    }))
+    asyncio.run(service.embeddings_collection.insert_many([
+        {"owner_id": "public", "conversation_id": "c1", "index": i,
+         "message_id": f"m{i}", "embedding": Binary(b"\0" * 4)}
+        for i in range(3)
+    ]))
+    return service
+
+
+def test_disconnect_polls_and_cancels_the_upstream_call(ai):
+    polls = []
+
+    async def is_disconnected():
+        polls.append(True)
+        return len(polls) >= 3
+
+    with pytest.raises(GenerationCancelled) as raised:
+        asyncio.run(ai.generate_response_with_usage([], "no-such-mode", is_disconnected=is_disconnected))
+
+    assert len(polls) == 3
+    assert ai.client.chat.completions.cancelled
+    assert (raised.value.mode, raised.value.model) == ("default", MODEL)
+
+
+def test_mark_message_cancelled_flags_message_and_vector(memory):
+    assert asyncio.run(memory.mark_message_cancelled("c1", "m1"))
+
+    conversation = asyncio.run(memory.collection.find_one({"conversation_id": "c1"}))
+    assert [msg.get("cancelled") for msg in conversation["messages"]] == [None, True, None]
+    vector = asyncio.run(memory.embeddings_collection.find_one({"message_id": "m1"}))
+    assert vector["cancelled"] is True
+
+
+def test_cancelled_message_is_excluded_from_history_and_vectors(memory):
+    asyncio.run(memory.mark_message_cancelled("c1", "m1"))
+
+    history = asyncio.run(memory.get_conversation("c1"))
+    assert [msg["content"] for msg in history] == ["message 0", "message 2"]
+    indexes, _ = asyncio.run(memory.get_embeddings("c1"))
+    assert indexes == [0, 2]
+
+
+def test_record_cancellation_counts_hour_and_day():
+    usage = UsageService()
+    usage._collection = AsyncMongoMockClient()["test"]["usage_rollups"]
+    asyncio.run(usage.record_cancellation("default", MODEL))
+    asyncio.run(usage.record_cancellation("default", MODEL))
+
+    rows = asyncio.run(usage.collection.find({}, {"_id": 0}).to_list(length=None))
+    assert sorted(row["granularity"] for row in rows) == ["day", "hour"]
+    assert all(row["cancelled"] == 2 and row["model"] == MODEL for row in rows)
+
+
+class FakeMemory:
+    def __init__(self):
+        self.cancelled = []
+
+    async def add_message(self, conversation_id, role, content, usage=None, embedding=None, owner_id=None):
+        return "m-new"
+
+    async def get_conversation(self, conversation_id, owner_id=None):
+        return [{"role": "user", "content": "hi"}]
+
+    async def mark_message_cancelled(self, conversation_id, message_id, owner_id):
+        self.cancelled.append((conversation_id, message_id, owner_id))
+
+
+class FakeUsage:
+    def __init__(self):
+        self.cancellations = []
+
+    async def record_cancellation(self, mode, model):
+        self.cancellations.append((mode, model))
+
+
+def test_chat_turn_marks_and_records_cancellation(ai, monkeypatch):
+    memory, usage = FakeMemory(), FakeUsage()
+    monkeypatch.setattr(main, "ai_service", ai)
+    monkeypatch.setattr(main, "memory_service", memory)
+    monkeypatch.setattr(main, "usage_service", usage)
+    monkeypatch.setattr(main.retrieval_service, "memory_service", memory)
+
+    async def is_disconnected():
+        return True
+
+    request = ChatRequest(message="hi", mode="mentor", conversation_id="c1")
+    with pytest.raises(GenerationCancelled):
+        asyncio.run(main._run_chat_turn(request, "public", is_disconnected))
+
+    assert memory.cancelled == [("c1", "m-new", "public")]
+    assert usage.cancellations == [("mentor", MODEL)]
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.memory_service import MemoryService, COMPRESSION_MIN_BYTES
+
+
+@pytest.fixture
+def service():
+    service = MemoryService()
+    service._db = AsyncMongoMockClient()["test"]
+    return service
+
+
+def write(service, content: str):
+    service._record_compression(content, service._encode_content(content))
+
+
+def test_counts_stay_in_process_until_flushed(service):
+    async def scenario():
+        write(service, "short")
+        write(service, "x" * (COMPRESSION_MIN_BYTES * 4))
+        assert await service.stats_collection.find_one({"_id": "message_compression"}) is None
+
+        stats = await service.get_compression_stats()
+        assert stats["messages"] == 2
+        assert stats["compressed_messages"] == 1
+        assert stats["ratio"] > 1
+
+        await service.flush_compression_stats()
+        stored = await service.stats_collection.find_one({"_id": "message_compression"})
+        assert stored["messages"] == 2
+        assert (await service.get_compression_stats())["messages"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_flushes_add_up(service):
+    async def scenario():
+        write(service, "one")
+        await service.flush_compression_stats()
+        write(service, "two")
+        await service.flush_compression_stats()
+        await service.flush_compression_stats()
+        stored = await service.stats_collection.find_one({"_id": "message_compression"})
+        assert stored["messages"] == 2
+        assert stored["raw_bytes"] == 6
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from starlette.requests import Request
+
+from fastapi.testclient import TestClient
+
+import main
+from main import _validators, _not_modified
+
+UPDATED_AT = datetime(2026, 3, 1, 12, 30, 45, 123000)
+
+
+def make_request(**headers) -> Request:
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+def test_validators_are_stable_for_the_same_version():
+    assert _validators("abc", UPDATED_AT) == _validators("abc", UPDATED_AT)
+    assert _validators("abc", UPDATED_AT)["Last-Modified"] == "Sun, 01 Mar 2026 12:30:45 GMT"
+
+
+def test_etag_changes_with_updated_at():
+    later = UPDATED_AT.replace(microsecond=124000)
+    assert _validators("abc", UPDATED_AT)["ETag"] != _validators("abc", later)["ETag"]
+
+
+def test_if_none_match():
+    headers = _validators("abc", UPDATED_AT)
+    assert _not_modified(make_request(if_none_match=headers["ETag"]), headers, UPDATED_AT)
+    assert _not_modified(make_request(if_none_match=f'"other", W/{headers["ETag"]}'), headers, UPDATED_AT)
+    assert _not_modified(make_request(if_none_match="*"), headers, UPDATED_AT)
+    assert not _not_modified(make_request(if_none_match='"stale"'), headers, UPDATED_AT)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    headers = _validators("abc", UPDATED_AT)
+    request = make_request(if_none_match='"stale"', if_modified_since=headers["Last-Modified"])
+    assert not _not_modified(request, headers, UPDATED_AT)
+
+
+def test_if_modified_since():
+    headers = _validators("abc", UPDATED_AT)
+    assert _not_modified(make_request(if_modified_since="Sun, 01 Mar 2026 12:30:45 GMT"), headers, UPDATED_AT)
+    assert not _not_modified(make_request(if_modified_since="Sun, 01 Mar 2026 12:30:44 GMT"), headers, UPDATED_AT)
+
+
+def test_if_modified_since_with_unknown_offset_is_treated_as_utc():
+    headers = _validators("abc", UPDATED_AT)
+    request = make_request(if_modified_since="Sun, 01 Mar 2026 12:30:45 -0000")
+    assert _not_modified(request, headers, UPDATED_AT)
+
+
+def test_malformed_if_modified_since_is_ignored():
+    headers = _validators("abc", UPDATED_AT)
+    assert not _not_modified(make_request(if_modified_since="yesterday"), headers, UPDATED_AT)
+
+
+class FakeMemoryService:
+    def __init__(self):
+        self.calls = []
+
+    async def get_conversation_updated_at(self, conversation_id, owner_id):
+        self.calls.append("updated_at")
+        return UPDATED_AT
+
+    async def get_conversation_detail(self, conversation_id, isoformat=True, owner_id=None):
+        self.calls.append("detail")
+        return {"conversation_id": conversation_id, "messages": [], "updated_at": UPDATED_AT}
+
+
+def test_unconditional_get_reads_the_conversation_once(monkeypatch):
+    fake = FakeMemoryService()
+    monkeypatch.setattr(main, "memory_service", fake)
+    response = TestClient(main.app).get("/conversation/abc")
+    assert response.status_code == 200
+    assert fake.calls == ["detail"]
+    assert response.headers["ETag"] == _validators("abc", UPDATED_AT)["ETag"]
+
+
+def test_matching_etag_skips_the_detail_read(monkeypatch):
+    fake = FakeMemoryService()
+    monkeypatch.setattr(main, "memory_service", fake)
+    etag = _validators("abc", UPDATED_AT)["ETag"]
+    response = TestClient(main.app).get("/conversation/abc", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert fake.calls == ["updated_at"]
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import services.idempotency_service as idempotency
+from services.idempotency_service import IdempotencyService, IdempotencyKeyReused, IdempotencyInProgress
+
+FINGERPRINT = IdempotencyService.fingerprint("hello", "default", None)
+RESPONSE = {"response": "hi there", "conversation_id": "c1"}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    service = IdempotencyService()
+    service._collection = AsyncMongoMockClient()["test"]["idempotency_keys"]
+    return service
+
+
+def test_first_attempt_owns_the_key(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        stored = await service.collection.find_one({"_id": "k"})
+        assert stored["status"] == "in_progress"
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_waits_for_in_progress_attempt(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        duplicate = asyncio.create_task(service.claim("k", FINGERPRINT, wait_seconds=5))
+        await asyncio.sleep(0.05)
+        assert not duplicate.done()
+
+        await service.complete("k", RESPONSE)
+        assert await asyncio.wait_for(duplicate, 1) == RESPONSE
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_gives_up_after_wait_limit(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        with pytest.raises(IdempotencyInProgress):
+            await service.claim("k", FINGERPRINT, wait_seconds=0.05)
+
+    asyncio.run(scenario())
+
+
+def test_completed_response_is_replayed(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        await service.complete("k", RESPONSE)
+        assert await service.claim("k", FINGERPRINT) == RESPONSE
+        assert await service.claim("k", FINGERPRINT) == RESPONSE
+
+    asyncio.run(scenario())
+
+
+def test_key_reused_with_different_body(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        other = IdempotencyService.fingerprint("something else", "default", None)
+        with pytest.raises(IdempotencyKeyReused):
+            await service.claim("k", other)
+
+    asyncio.run(scenario())
+
+
+def test_expired_lock_is_taken_over(service):
+    async def scenario():
+        now = datetime.utcnow()
+        await service.collection.insert_one({
+            "_id": "k",
+            "fingerprint": FINGERPRINT,
+            "status": "in_progress",
+            "locked_until": now - timedelta(seconds=1),
+            "created_at": now - timedelta(minutes=5)
+        })
+        assert await service.claim("k", FINGERPRINT, wait_seconds=0.5) is None
+        stored = await service.collection.find_one({"_id": "k"})
+        assert stored["locked_until"] > now
+
+    asyncio.run(scenario())
+
+
+def test_release_lets_a_retry_run(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        await service.release("k")
+        assert await service.collection.find_one({"_id": "k"}) is None
+        assert await service.claim("k", FINGERPRINT) is None
+
+    asyncio.run(scenario())
+
+
+def test_release_keeps_completed_result(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        await service.complete("k", RESPONSE)
+        await service.release("k")
+        assert await service.claim("k", FINGERPRINT) == RESPONSE
+
+    asyncio.run(scenario())
+
+
+def test_waiting_duplicate_runs_after_release(service):
+    async def scenario():
+        assert await service.claim("k", FINGERPRINT) is None
+        duplicate = asyncio.create_task(service.claim("k", FINGERPRINT, wait_seconds=5))
+        await asyncio.sleep(0.05)
+        await service.release("k")
+        assert await asyncio.wait_for(duplicate, 1) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.memory_service import MemoryService, DEFAULT_OWNER
+
+
+@pytest.fixture
+def service():
+    service = MemoryService()
+    service._collection = AsyncMongoMockClient()["test"]["conversations"]
+    return service
+
+
+def seed(service, count: int, conversation_id: str = "c1"):
+    start = datetime(2026, 1, 1)
+    asyncio.run(service.collection.insert_one({
+        "owner_id": DEFAULT_OWNER,
+        "conversation_id": conversation_id,
+        "messages": [
+            {"role": "user", "content": f"m{i}", "timestamp": start + timedelta(seconds=i)}
+            for i in range(count)
+        ],
+        "created_at": start,
+        "updated_at": start
+    }))
+
+
+def contents(page):
+    return [msg["content"] for msg in page["messages"]]
+
+
+def test_newest_page(service):
+    seed(service, 45)
+    page = asyncio.run(service.get_messages_page("c1", limit=20))
+    assert page["total"] == 45
+    assert page["start"] == 25
+    assert contents(page) == [f"m{i}" for i in range(25, 45)]
+
+
+def test_walking_back_to_the_first_message(service):
+    seed(service, 45)
+    page = asyncio.run(service.get_messages_page("c1", before=25, limit=20))
+    assert page["start"] == 5
+    assert contents(page) == [f"m{i}" for i in range(5, 25)]
+
+    page = asyncio.run(service.get_messages_page("c1", before=5, limit=20))
+    assert page["start"] == 0
+    assert contents(page) == [f"m{i}" for i in range(0, 5)]
+
+
+def test_before_zero_is_empty(service):
+    seed(service, 3)
+    page = asyncio.run(service.get_messages_page("c1", before=0, limit=20))
+    assert page == {"messages": [], "start": 0, "total": 3}
+
+
+def test_before_past_the_end_is_clamped(service):
+    seed(service, 3)
+    page = asyncio.run(service.get_messages_page("c1", before=50, limit=20))
+    assert page["start"] == 0
+    assert contents(page) == ["m0", "m1", "m2"]
+
+
+def test_empty_conversation(service):
+    seed(service, 0)
+    page = asyncio.run(service.get_messages_page("c1", limit=20))
+    assert page == {"messages": [], "start": 0, "total": 0}
+
+
+def test_unknown_conversation_and_other_owner(service):
+    seed(service, 3)
+    assert asyncio.run(service.get_messages_page("missing")) is None
+    assert asyncio.run(service.get_messages_page("c1", owner_id="someone-else")) is None
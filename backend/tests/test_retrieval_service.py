@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from bson import Binary
+from mongomock_motor import AsyncMongoMockClient
+
+from services.memory_service import MemoryService
+from services.retrieval_service import RetrievalService
+
+
+@pytest.fixture
+def retrieval():
+    memory = MemoryService()
+    memory._db = AsyncMongoMockClient()["test"]
+    retrieval = RetrievalService(memory)
+    retrieval.enabled = True
+    return retrieval
+
+
+def add(retrieval, *contents: str):
+    """Store messages and their vectors directly (mongomock lacks $size projections)"""
+    memory = retrieval.memory_service
+    for content in contents:
+        count = asyncio.run(memory.embeddings_collection.count_documents({}))
+        asyncio.run(memory.collection.update_one(
+            {"owner_id": "public", "conversation_id": "c1"},
+            {"$push": {"messages": {"role": "user", "content": content}}},
+            upsert=True
+        ))
+        asyncio.run(memory.embeddings_collection.insert_one({
+            "owner_id": "public", "conversation_id": "c1", "index": count,
+            "message_id": f"m{count}", "embedding": Binary(retrieval.embed(content))
+        }))
+
+
+class CountingMemory:
+    """Wraps MemoryService to record which index ranges get_embeddings reads"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.reads = []
+
+    def __getattr__(self, name):
+        return getattr(self.memory, name)
+
+    async def get_embeddings(self, conversation_id, after_index=-1, before_index=None, owner_id=None):
+        indexes, embeddings = await self.memory.get_embeddings(conversation_id, after_index, before_index, owner_id)
+        self.reads.append(indexes)
+        return indexes, embeddings
+
+
+def test_skip_window_is_excluded_in_the_query(retrieval):
+    add(retrieval, "alpha", "beta", "gamma", "delta")
+    indexes, _ = asyncio.run(retrieval._older_vectors("c1", 2, "public"))
+    assert indexes == [0, 1]
+
+
+def test_only_new_rows_are_read_on_later_turns(retrieval):
+    retrieval.memory_service = CountingMemory(retrieval.memory_service)
+    add(retrieval, "alpha", "beta", "gamma")
+    asyncio.run(retrieval._older_vectors("c1", 1, "public"))
+    add(retrieval, "delta", "epsilon")
+    indexes, matrix = asyncio.run(retrieval._older_vectors("c1", 1, "public"))
+
+    assert retrieval.memory_service.reads == [[0, 1], [2, 3]]
+    assert indexes == [0, 1, 2, 3]
+    assert matrix.shape == (4, retrieval.dim)
+
+
+def test_forget_drops_cached_rows(retrieval):
+    add(retrieval, "alpha", "beta", "gamma")
+    asyncio.run(retrieval._older_vectors("c1", 1, "public"))
+    retrieval.forget("c1", "public")
+    assert ("public", "c1") not in retrieval._matrices
+
+
+def test_top_k_ranks_cached_rows(retrieval):
+    add(retrieval, "weather is sunny", "the launch code is tangerine", "unrelated chatter", "more chatter")
+    indexes, matrix = asyncio.run(retrieval._older_vectors("c1", 2, "public"))
+    best = retrieval.top_k("what is the launch code", matrix, 1)
+    assert [indexes[i] for i in best] == [1]
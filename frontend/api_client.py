@@ -0,0 +1,211 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Configuration
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# Owner (user/tenant) whose conversations this frontend reads and writes
+OWNER_ID = os.getenv("OWNER_ID", "public")
+
+# (connect, read) timeouts in seconds. Chat waits on the LLM so it gets a longer read timeout.
+DEFAULT_TIMEOUT = (3, 10)
+CHAT_TIMEOUT = (3, 120)
+
+DEFAULT_MODES = ["default", "mentor", "exam"]
+
+# Extra attempts for /chat after a dropped connection or timeout. Safe because every
+# attempt carries the same Idempotency-Key, so the backend runs the turn only once.
+CHAT_RETRIES = 2
+
+# Conversation details kept in memory (shared by all sessions)
+DETAIL_CACHE_SIZE = 256
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Shared HTTP session with a keep-alive connection pool, reused across reruns"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _get(path: str, **kwargs) -> requests.Response:
+    return get_session().get(f"{API_BASE_URL}{path}", timeout=DEFAULT_TIMEOUT, **kwargs)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_available_modes() -> List[str]:
+    """Fetch available AI modes from backend"""
+    try:
+        response = _get("/modes")
+        if response.status_code == 200:
+            return response.json()["modes"]
+        return DEFAULT_MODES
+    except requests.RequestException:
+        return DEFAULT_MODES
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def get_health() -> Optional[Dict]:
+    """Fetch backend health, None if the backend is unreachable"""
+    try:
+        response = _get("/")
+        if response.status_code == 200:
+            return response.json()
+        return {"status": "error", "status_code": response.status_code}
+    except requests.RequestException:
+        return None
+
+
+def get_modes_and_health():
+    """Fetch modes and health concurrently so a cold rerun waits for one round trip, not two"""
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=2,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        modes = executor.submit(get_available_modes)
+        health = executor.submit(get_health)
+        return modes.result(), health.result()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_all_conversations() -> List[Dict]:
+    """Fetch all conversations from backend"""
+    try:
+        response = _get("/conversation", params={"owner_id": OWNER_ID})
+        if response.status_code == 200:
+            return response.json()["conversations"]
+        return []
+    except requests.RequestException:
+        return []
+
+
+@st.cache_resource
+def _validated_details() -> "OrderedDict[str, tuple]":
+    """LRU of conversation_id -> (ETag, body) of the last full detail response"""
+    return OrderedDict()
+
+
+# Streamlit runs sessions on separate threads
+_validated_lock = threading.Lock()
+
+
+@st.cache_data(ttl=60, show_spinner=False, max_entries=DETAIL_CACHE_SIZE)
+def get_conversation_detail(conversation_id: str) -> Optional[Dict]:
+    """Fetch full conversation detail, revalidating with the backend's ETag"""
+    validated = _validated_details()
+    with _validated_lock:
+        cached = validated.get(conversation_id)
+        if cached:
+            validated.move_to_end(conversation_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    try:
+        response = _get(f"/conversation/{conversation_id}", params={"owner_id": OWNER_ID}, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code == 200:
+            detail = response.json()
+            if "ETag" in response.headers:
+                with _validated_lock:
+                    validated[conversation_id] = (response.headers["ETag"], detail)
+                    validated.move_to_end(conversation_id)
+                    while len(validated) > DETAIL_CACHE_SIZE:
+                        validated.popitem(last=False)
+            return detail
+        with _validated_lock:
+            validated.pop(conversation_id, None)
+        return None
+    except requests.RequestException:
+        return None
+
+
+def get_messages_page(conversation_id: str, before: Optional[int] = None, limit: int = 20) -> Optional[Dict]:
+    """Fetch one page of messages; the newest page when `before` is None"""
+    params = {"limit": limit, "owner_id": OWNER_ID}
+    if before is not None:
+        params["before"] = before
+    try:
+        response = _get(f"/conversation/{conversation_id}/messages", params=params)
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except requests.RequestException:
+        return None
+
+
+def send_message(message: str, mode: str, conversation_id: Optional[str] = None) -> Dict:
+    """Send message to backend and get response"""
+    payload = {
+        "message": message,
+        "mode": mode,
+        "owner_id": OWNER_ID
+    }
+    if conversation_id:
+        payload["conversation_id"] = conversation_id
+
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    for attempt in range(CHAT_RETRIES + 1):
+        try:
+            response = get_session().post(
+                f"{API_BASE_URL}/chat",
+                json=payload,
+                headers=headers,
+                timeout=CHAT_TIMEOUT
+            )
+            break
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt < CHAT_RETRIES:
+                continue
+            error = e
+        except requests.RequestException as e:
+            error = e
+        return {
+            "response": f"Connection error: {str(error)}. Make sure backend is running on {API_BASE_URL}",
+            "conversation_id": conversation_id
+        }
+
+    if response.status_code != 200:
+        return {
+            "response": f"Error: {response.status_code} - {response.text}",
+            "conversation_id": conversation_id
+        }
+
+    data = response.json()
+    invalidate_conversation(data["conversation_id"])
+    return data
+
+
+def delete_conversation(conversation_id: str) -> bool:
+    """Delete a conversation"""
+    try:
+        response = get_session().delete(
+            f"{API_BASE_URL}/conversation/{conversation_id}",
+            params={"owner_id": OWNER_ID},
+            timeout=DEFAULT_TIMEOUT
+        )
+    except requests.RequestException:
+        return False
+
+    if response.status_code == 200:
+        invalidate_conversation(conversation_id)
+        return True
+    return False
+
+
+def invalidate_conversation(conversation_id: str):
+    """Drop cached data that a write to this conversation makes stale"""
+    get_all_conversations.clear()
+    get_conversation_detail.clear(conversation_id)
+    with _validated_lock:
+        _validated_details().pop(conversation_id, None)
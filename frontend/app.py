@@ -1,11 +1,20 @@
 import streamlit as st
-import requests
 import json
 from typing import Optional, List, Dict
 from datetime import datetime
 
-# Configuration
-API_BASE_URL = "http://localhost:8000"
+from api_client import (
+    API_BASE_URL,
+    get_modes_and_health,
+    send_message,
+    get_all_conversations,
+    get_conversation_detail,
+    get_messages_page,
+    delete_conversation,
+)
+
+# Number of messages rendered at once and fetched per "load earlier" click
+WINDOW_SIZE = 20
 
 # Page config
 st.set_page_config(
@@ -25,98 +34,55 @@ if "messages" not in st.session_state:
 if "mode" not in st.session_state:
     st.session_state.mode = "default"
 
+if "history_start" not in st.session_state:
+    # Backend index of the oldest message held in st.session_state.messages
+    st.session_state.history_start = 0
+
+if "visible_count" not in st.session_state:
+    st.session_state.visible_count = WINDOW_SIZE
+
 if "show_sidebar" not in st.session_state:
     st.session_state.show_sidebar = True
 
-if "all_conversations" not in st.session_state:
-    st.session_state.all_conversations = []
-
 # Helper functions
-def get_available_modes():
-    """Fetch available AI modes from backend"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/modes")
-        if response.status_code == 200:
-            return response.json()["modes"]
-        return ["default", "mentor", "exam"]
-    except:
-        return ["default", "mentor", "exam"]
-
-def send_message(message: str, mode: str, conversation_id: Optional[str] = None):
-    """Send message to backend and get response"""
-    try:
-        payload = {
-            "message": message,
-            "mode": mode
-        }
-        
-        if conversation_id:
-            payload["conversation_id"] = conversation_id
-        
-        response = requests.post(
-            f"{API_BASE_URL}/chat",
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {
-                "response": f"Error: {response.status_code} - {response.text}",
-                "conversation_id": conversation_id
-            }
-    except Exception as e:
-        return {
-            "response": f"Connection error: {str(e)}. Make sure backend is running on {API_BASE_URL}",
-            "conversation_id": conversation_id
-        }
-
-def get_all_conversations():
-    """Fetch all conversations from backend"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/conversation")
-        if response.status_code == 200:
-            return response.json()["conversations"]
-        return []
-    except:
-        return []
-
-def get_conversation_detail(conversation_id: str):
-    """Fetch full conversation detail"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/conversation/{conversation_id}")
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except:
-        return None
-
-def delete_conversation(conversation_id: str):
-    """Delete a conversation"""
-    try:
-        response = requests.delete(f"{API_BASE_URL}/conversation/{conversation_id}")
-        return response.status_code == 200
-    except:
+def load_conversation(conversation_id: str, mode: str = "default"):
+    """Load the most recent page of a conversation into the chat"""
+    page = get_messages_page(conversation_id, limit=WINDOW_SIZE)
+    if page is None:
         return False
+    st.session_state.conversation_id = conversation_id
+    st.session_state.mode = mode
+    st.session_state.messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in page["messages"]
+    ]
+    st.session_state.history_start = page["start"]
+    st.session_state.visible_count = WINDOW_SIZE
+    return True
 
-def load_conversation(conversation_id: str):
-    """Load a conversation into the chat"""
-    detail = get_conversation_detail(conversation_id)
-    if detail:
-        st.session_state.conversation_id = conversation_id
-        st.session_state.mode = detail.get("mode", "default")
-        st.session_state.messages = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in detail.get("messages", [])
-        ]
-        return True
-    return False
+def show_earlier_messages():
+    """Widen the render window, fetching an older page from the backend when needed"""
+    hidden = len(st.session_state.messages) - st.session_state.visible_count
+    if hidden < WINDOW_SIZE and st.session_state.history_start > 0:
+        page = get_messages_page(
+            st.session_state.conversation_id,
+            before=st.session_state.history_start,
+            limit=WINDOW_SIZE
+        )
+        if page:
+            st.session_state.messages = [
+                {"role": msg["role"], "content": msg["content"]}
+                for msg in page["messages"]
+            ] + st.session_state.messages
+            st.session_state.history_start = page["start"]
+    st.session_state.visible_count += WINDOW_SIZE
 
 def clear_conversation():
     """Clear conversation history"""
     st.session_state.conversation_id = None
     st.session_state.messages = []
+    st.session_state.history_start = 0
+    st.session_state.visible_count = WINDOW_SIZE
 
 def export_conversation_json(conversation_id: str):
     """Export conversation as JSON"""
@@ -205,7 +171,7 @@ with st.sidebar:
     st.header("⚙️ Settings")
     
     # Mode selector
-    available_modes = get_available_modes()
+    available_modes, health = get_modes_and_health()
     mode_descriptions = {
         "default": "Helpful and friendly general assistant",
         "mentor": "Guides you through problems with questions",
@@ -239,7 +205,7 @@ with st.sidebar:
     if st.session_state.conversation_id:
         st.success("Active")
         st.caption(f"ID: {st.session_state.conversation_id[:8]}...")
-        st.metric("Messages", len(st.session_state.messages))
+        st.metric("Messages", st.session_state.history_start + len(st.session_state.messages))
     else:
         st.warning("No active conversation")
         st.metric("Messages", 0)
@@ -248,17 +214,14 @@ with st.sidebar:
     
     # Backend status
     st.subheader("System Status")
-    try:
-        response = requests.get(f"{API_BASE_URL}/")
-        if response.status_code == 200:
-            data = response.json()
-            st.success("✅ Backend Online")
-            st.caption(f"Version: {data.get('version', 'N/A')}")
-            st.caption(f"Database: {data.get('database', 'N/A')}")
-        else:
-            st.error("❌ Backend Error")
-    except:
+    if health is None:
         st.error("❌ Backend Offline")
+    elif health.get("status") == "healthy":
+        st.success("✅ Backend Online")
+        st.caption(f"Version: {health.get('version', 'N/A')}")
+        st.caption(f"Database: {health.get('database', 'N/A')}")
+    else:
+        st.error("❌ Backend Error")
     
     st.caption(f"API: {API_BASE_URL}")
 
@@ -272,8 +235,18 @@ with col1:
     
     st.divider()
     
-    # Display chat messages
-    for message in st.session_state.messages:
+    # Display only the most recent window of messages
+    hidden_count = (
+        st.session_state.history_start
+        + max(len(st.session_state.messages) - st.session_state.visible_count, 0)
+    )
+    if hidden_count:
+        st.button(
+            f"⬆️ Load earlier messages ({hidden_count} hidden)",
+            on_click=show_earlier_messages,
+            use_container_width=True
+        )
+    for message in st.session_state.messages[-st.session_state.visible_count:]:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     
@@ -316,16 +289,15 @@ with col2:
     
     # Refresh button
     if st.button("🔄 Refresh", use_container_width=True):
-        st.session_state.all_conversations = get_all_conversations()
+        get_all_conversations.clear()
     
-    # Load conversations
-    if not st.session_state.all_conversations:
-        st.session_state.all_conversations = get_all_conversations()
+    # Load conversations (cached; invalidated after chat and delete)
+    all_conversations = get_all_conversations()
     
     # Filter conversations
     filtered_conversations = search_conversations(
         search_query, 
-        st.session_state.all_conversations
+        all_conversations
     )
     
     st.caption(f"Found {len(filtered_conversations)} conversation(s)")
@@ -352,7 +324,7 @@ with col2:
                         key=f"load_{conv_id}",
                         use_container_width=True
                     ):
-                        if load_conversation(conv_id):
+                        if load_conversation(conv_id, conv.get("mode", "default")):
                             st.rerun()
                     
                     # Metadata
@@ -397,7 +369,6 @@ with col2:
                                 st.success("Deleted!")
                                 if conv_id == st.session_state.conversation_id:
                                     clear_conversation()
-                                st.session_state.all_conversations = get_all_conversations()
                                 st.rerun()
                             else:
                                 st.error("Failed to delete")